@@ -0,0 +1,89 @@
+#
+#
+#  Benchmark of mask retrieval: nested GetDataShorts lists vs flat bytes
+#
+#  Uses a local stand-in for an Imaris mask data set which serves a random
+#  blob mask through both accessors in the form ImarisLib returns them
+#  (nested Python lists for GetDataShorts, bytes for the 1D byte accessor),
+#  so no running Imaris is needed.
+#
+#    python benchmarks/mask_conversion.py --size 256 256 64
+#
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "xt_swc")
+)
+import mask_buffers  # noqa: E402
+
+
+class MaskDataSetStandIn:
+    def __init__(self, mask, uint8=True):
+        self.mask = mask.astype(np.uint8)
+        self.uint8 = uint8
+
+    def GetType(self):
+        return "tType.eTypeUInt8" if self.uint8 else "tType.eTypeUInt16"
+
+    def GetSizeX(self):
+        return self.mask.shape[0]
+
+    def GetSizeY(self):
+        return self.mask.shape[1]
+
+    def GetSizeZ(self):
+        return self.mask.shape[2]
+
+    def GetDataShorts(self):
+        return self.mask.astype(np.int16)[None, None].tolist()
+
+    def GetDataVolumeAs1DArrayBytes(self, aIndexC, aIndexT):
+        return self.mask.T.tobytes()
+
+
+def timeIt(fn, repeats):
+    best = np.inf
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, nargs=3, default=[128, 128, 32])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    mask = rng.random(args.size) < 0.3
+
+    nested = MaskDataSetStandIn(mask, uint8=False)
+    flat = MaskDataSetStandIn(mask, uint8=True)
+
+    # the data transfer itself is not part of the conversion
+    shorts = nested.GetDataShorts()
+    nested.GetDataShorts = lambda: shorts
+    buf = flat.GetDataVolumeAs1DArrayBytes(0, 0)
+    flat.GetDataVolumeAs1DArrayBytes = lambda c, t: buf
+
+    t_nested, a = timeIt(lambda: mask_buffers.getMaskArray(nested), args.repeats)
+    t_flat, b = timeIt(lambda: mask_buffers.getMaskArray(flat), args.repeats)
+    assert np.array_equal(a, mask) and np.array_equal(b, mask)
+
+    n = mask.size
+    print(f"mask {' x '.join(map(str, args.size))} ({n} voxels)")
+    print(f"GetDataShorts (nested lists): {t_nested * 1e3:9.2f} ms")
+    print(f"1D byte buffer (frombuffer):  {t_flat * 1e3:9.2f} ms")
+    print(f"speedup: {t_nested / t_flat:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
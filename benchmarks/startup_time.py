@@ -0,0 +1,84 @@
+#
+#
+#  Startup-time benchmark for the XTensions
+#
+#  Imports each XTension module in a fresh Python (as Imaris does for every
+#  menu click) and reports the time until its first dialog could be shown,
+#  plus which heavy dependencies were already loaded at that point.
+#
+#  Run with the Imaris Python, e.g.
+#    python benchmarks/startup_time.py --imarislib "C:/Program Files/Bitplane/Imaris x64 9.7.2/XT/python3"
+#
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+XT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "xt_swc")
+
+MODULES = [
+    "export_swc_with_surface_interection",
+    "export_surface_label_image",
+    "exportswc",
+    "importswc",
+]
+
+HEAVY = ["numpy", "pandas", "scipy", "skimage", "tifffile", "tqdm"]
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+print(json.dumps({{
+    "seconds": t1 - t0,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def timeImport(module, python_path, repeats):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(python_path)
+
+    seconds = []
+    loaded = []
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if out.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{out.stderr}")
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        seconds.append(result["seconds"])
+        loaded = result["loaded"]
+
+    return statistics.median(seconds), min(seconds), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--imarislib", default="", help="folder containing ImarisLib")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    python_path = [os.path.abspath(XT_DIR)]
+    if args.imarislib:
+        python_path.append(args.imarislib)
+
+    print(f"{'module':40s} {'median [s]':>10s} {'min [s]':>8s}  heavy modules loaded")
+    for module in MODULES:
+        median, best, loaded = timeImport(module, python_path, args.repeats)
+        print(f"{module:40s} {median:10.3f} {best:8.3f}  {', '.join(loaded) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#
+#
+#  Background writing of output files
+#
+#  Writing tables and images to network shares can take seconds per file.
+#  Write jobs are queued to a single writer thread so that the next surface
+#  or filament is computed meanwhile. Every file is written to a temporary
+#  file next to it and renamed when complete, so readers never see partial
+#  output.
+#
+
+import os
+import queue
+import threading
+import time
+
+# jobs waiting for the writer before submit blocks (bounds queued data)
+MAX_PENDING = 4
+
+
+def atomicWrite(path, write):
+    """Call write(tmp_path), then rename tmp_path to path; returns bytes written"""
+    tmp_path = f"{path}.tmp"
+    try:
+        write(tmp_path)
+        n_bytes = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return n_bytes
+
+
+class BackgroundWriter:
+    """Queue of write jobs executed by a writer thread
+
+    Errors of write jobs are raised by the next submit or by close.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self._jobs = queue.Queue(max_pending)
+        self._error = None
+        self.n_files = 0
+        self.n_bytes = 0
+        self.write_seconds = 0.0
+        self._thread = threading.Thread(
+            target=self._run, name="xt_swc_writer", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            path, write = job
+            if self._error is not None:
+                continue
+            try:
+                start = time.perf_counter()
+                self.n_bytes += atomicWrite(path, write)
+                self.write_seconds += time.perf_counter() - start
+                self.n_files += 1
+                print(f"Written {path}")
+            except BaseException as e:
+                self._error = e
+
+    def _raiseError(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, path, write):
+        """Queue write(tmp_path) for path; the data written must not change anymore"""
+        self._raiseError()
+        if not self._thread.is_alive():
+            raise RuntimeError("BackgroundWriter is closed")
+        self._jobs.put((path, write))
+
+    def close(self):
+        """Wait for all queued writes"""
+        if self._thread.is_alive():
+            self._jobs.put(None)
+            self._thread.join()
+        self._raiseError()
+
+    def summary(self):
+        mb = self.n_bytes / 2**20
+        rate = mb / self.write_seconds if self.write_seconds > 0 else 0.0
+        return (
+            f"Wrote {self.n_files} files, {mb:.1f} MB in "
+            f"{self.write_seconds:.1f} s ({rate:.1f} MB/s)"
+        )
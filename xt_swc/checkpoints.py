@@ -0,0 +1,131 @@
+#
+#
+#  Checkpoints for long surface rasterization runs
+#
+#  Rasterized objects (index, block position and packed mask) are appended
+#  to a checkpoint directory as numbered chunk files every few seconds and
+#  when the run fails. The next run for the same dataset and surface
+#  replays them into its label store and continues with the remaining
+#  objects; a finished run removes its checkpoint.
+#
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+
+META_FILE = "checkpoint.json"
+
+
+def surfaceKey(file_name, surface_name, fingerprint, ds, dtype):
+    """Identity of a rasterization run; checkpoints of other runs are discarded
+
+    fingerprint: rasterize.surfaceFingerprint, covers IDs and object extents
+    """
+    return {
+        "file": file_name,
+        "surface": surface_name,
+        "fingerprint": fingerprint,
+        "shape": [ds.GetSizeX(), ds.GetSizeY(), ds.GetSizeZ()],
+        "extent": [
+            ds.GetExtendMinX(),
+            ds.GetExtendMinY(),
+            ds.GetExtendMinZ(),
+            ds.GetExtendMaxX(),
+            ds.GetExtendMaxY(),
+            ds.GetExtendMaxZ(),
+        ],
+        "dtype": np.dtype(dtype).str,
+    }
+
+
+def surfaceDirectory(checkpoint_dir, surface_name):
+    # the hash keeps names apart which only differ in replaced characters
+    name_hash = hashlib.sha1(surface_name.encode("utf-8")).hexdigest()[:8]
+    safe_name = re.sub(r"[^\w.-]", "_", surface_name)
+    return os.path.join(checkpoint_dir, f"{safe_name}_{name_hash}")
+
+
+class RasterCheckpoint:
+    """Journal of rasterized objects of one surface"""
+
+    def __init__(self, directory, key, interval=30.0):
+        self.directory = directory
+        self.key = key
+        self.interval = interval
+        self.n_chunks = 0
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def _chunkFile(self, n):
+        return os.path.join(self.directory, f"chunk_{n:06d}.npz")
+
+    def resume(self, label_img, paint):
+        """Replay a matching checkpoint into label_img via paint(label_img, start, mask, value)
+
+        Returns the set of object indices already done.
+        """
+        done = set()
+        meta_file = os.path.join(self.directory, META_FILE)
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            if meta.get("key") != self.key:
+                print(f"Discarding outdated checkpoint in {self.directory}")
+                shutil.rmtree(self.directory)
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+            with open(os.path.join(self.directory, META_FILE), "w") as f:
+                json.dump({"key": self.key}, f)
+            return done
+
+        while os.path.exists(self._chunkFile(self.n_chunks)):
+            with np.load(self._chunkFile(self.n_chunks)) as chunk:
+                sizes = np.prod(chunk["shapes"], axis=1)
+                bits = np.unpackbits(chunk["bits"], count=int(sizes.sum()))
+                masks = np.split(bits.astype(bool), np.cumsum(sizes)[:-1])
+                for i, start, shape, mask in zip(
+                    chunk["indices"], chunk["starts"], chunk["shapes"], masks
+                ):
+                    if mask.size > 0:
+                        paint(label_img, start, mask.reshape(shape), i + 1)
+                    done.add(int(i))
+            self.n_chunks += 1
+
+        if done:
+            print(f"Resuming from checkpoint: {len(done)} objects already done")
+        return done
+
+    def record(self, i, start=None, mask=None):
+        """Mark object i done; start and mask are None for objects outside the image"""
+        if mask is None:
+            start, mask = np.zeros(3, int), np.zeros((0, 0, 0), bool)
+        self._pending.append((i, np.asarray(start), mask))
+        if time.monotonic() - self._last_flush > self.interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            indices, starts, masks = zip(*self._pending)
+            tmp_file = self._chunkFile(self.n_chunks) + ".tmp"
+            with open(tmp_file, "wb") as f:
+                np.savez(
+                    f,
+                    indices=np.array(indices, dtype=np.int64),
+                    starts=np.array(starts, dtype=np.int64),
+                    shapes=np.array([m.shape for m in masks], dtype=np.int64),
+                    bits=np.packbits(np.concatenate([m.ravel() for m in masks])),
+                )
+            os.replace(tmp_file, self._chunkFile(self.n_chunks))
+            self.n_chunks += 1
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def finish(self):
+        self._pending = []
+        shutil.rmtree(self.directory, ignore_errors=True)
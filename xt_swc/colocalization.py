@@ -0,0 +1,96 @@
+#
+#
+#  Object-by-object overlap of two label images
+#
+#  Only the intersection of the bounding boxes of both label images is
+#  visited, in slabs along x to bound temporary memory. Label pairs of
+#  overlapping voxels are counted per slab with a bincount if the label pair
+#  space is dense in them, with unique otherwise (sparse puncta), so memory
+#  scales with the overlapping voxels rather than with n_a * n_b.
+#
+
+import numpy as np
+
+SLAB_SIZE = 64
+
+# count with bincount if the pair space is at most this many times the pairs
+MAX_BINCOUNT_RATIO = 4
+
+
+def labelBoundingBox(label_img):
+    """Slices of the bounding box of all nonzero labels, None if empty"""
+    if hasattr(label_img, "chunks"):
+        # SparseLabelStore: only allocated chunks can contain labels
+        boxes = []
+        for key, chunk in label_img.chunks.items():
+            origin = np.array(key) * label_img.chunk_size
+            nz = np.nonzero(chunk)
+            if len(nz[0]) > 0:
+                boxes.append(
+                    [origin + [c.min() for c in nz], origin + [c.max() + 1 for c in nz]]
+                )
+        if not boxes:
+            return None
+        boxes = np.array(boxes)
+        start, stop = boxes[:, 0].min(axis=0), boxes[:, 1].max(axis=0)
+        return tuple(slice(a, b) for a, b in zip(start, stop))
+
+    box = []
+    for axis in range(label_img.ndim):
+        other = tuple(d for d in range(label_img.ndim) if d != axis)
+        present = np.flatnonzero(np.any(label_img, axis=other))
+        if len(present) == 0:
+            return None
+        box.append(slice(present[0], present[-1] + 1))
+    return tuple(box)
+
+
+def _countPairs(a, b, n_b):
+    both = (a > 0) & (b > 0)
+    pair = a[both].astype(np.int64) * n_b + b[both]
+    if len(pair) == 0:
+        return pair, pair
+    if pair.max() < MAX_BINCOUNT_RATIO * len(pair):
+        counts = np.bincount(pair)
+        pair = np.flatnonzero(counts)
+        return pair, counts[pair]
+    return np.unique(pair, return_counts=True)
+
+
+def overlapCounts(labels_a, labels_b, n_labels_b=None, box_a=None, box_b=None):
+    """Overlap voxel counts of all object pairs of two label images
+
+    n_labels_b: largest label in labels_b, if known (saves a pass over it)
+    box_a, box_b: labelBoundingBox of the label images, if known
+
+    Returns (label_a, label_b, n_voxels) of all pairs with n_voxels > 0.
+    """
+    empty = np.zeros(0, np.int64)
+    if box_a is None:
+        box_a = labelBoundingBox(labels_a)
+    if box_b is None:
+        box_b = labelBoundingBox(labels_b)
+    if box_a is None or box_b is None:
+        return empty, empty, empty
+
+    start = [max(sa.start, sb.start) for sa, sb in zip(box_a, box_b)]
+    stop = [min(sa.stop, sb.stop) for sa, sb in zip(box_a, box_b)]
+    if any(b <= a for a, b in zip(start, stop)):
+        return empty, empty, empty
+
+    if n_labels_b is None:
+        n_labels_b = labels_b.max()
+    n_b = int(n_labels_b) + 1
+    pairs = []
+    counts = []
+    for x in range(start[0], stop[0], SLAB_SIZE):
+        sl = (slice(x, min(x + SLAB_SIZE, stop[0])),) + tuple(
+            slice(a, b) for a, b in zip(start[1:], stop[1:])
+        )
+        p, c = _countPairs(np.asarray(labels_a[sl]), np.asarray(labels_b[sl]), n_b)
+        pairs.append(p)
+        counts.append(c)
+
+    pair, inverse = np.unique(np.concatenate(pairs), return_inverse=True)
+    n_voxels = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+    return pair // n_b, pair % n_b, n_voxels
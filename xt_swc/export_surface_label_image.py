@@ -17,6 +17,11 @@ import traceback
 
 try:
     # Standard library imports
+    import time
+
+    xt_start_time = time.perf_counter()
+
+    import functools
 
     # GUI imports
     import tkinter as tk
@@ -26,11 +31,15 @@ try:
     # Import ImarisLib
     import ImarisLib
 
-    # Non standard library imports
-    import tifffile
-    from skimage.transform import resize
-    import numpy as np
-    from tqdm.auto import trange
+    # Non standard library imports, deferred to first use
+    from lazy_import import lazyImport
+
+    tifffile = lazyImport("tifffile")
+    np = lazyImport("numpy")
+    label_stores = lazyImport("label_stores")
+    rasterize = lazyImport("rasterize")
+    checkpoints = lazyImport("checkpoints")
+    async_writer = lazyImport("async_writer")
 
 except:
     print(traceback.format_exc())
@@ -71,68 +80,6 @@ def getImaris(aImarisId):
     return vImaris, vDataSet, scene
 
 
-def getSurfaceLabelImage(surface, ds):
-    nSurfaces = len(surface.GetIds())
-
-    label_img = np.zeros((ds.GetSizeX(), ds.GetSizeY(), ds.GetSizeZ()), np.uint16)
-
-    voxel_len_x = (ds.GetExtendMaxX() - ds.GetExtendMinX()) / ds.GetSizeX()
-    voxel_len_y = (ds.GetExtendMaxY() - ds.GetExtendMinY()) / ds.GetSizeY()
-    voxel_len_z = (ds.GetExtendMaxZ() - ds.GetExtendMinZ()) / ds.GetSizeZ()
-
-    for i in trange(nSurfaces):
-        sl = surface.GetSurfaceDataLayout(i)
-
-        block_start_x = int((sl.mExtendMinX - ds.GetExtendMinX()) / voxel_len_x)
-        block_end_x = int((sl.mExtendMaxX - ds.GetExtendMinX()) / voxel_len_x + 1)
-
-        block_start_y = int((sl.mExtendMinY - ds.GetExtendMinY()) / voxel_len_y)
-        block_end_y = int((sl.mExtendMaxY - ds.GetExtendMinY()) / voxel_len_y + 1)
-
-        block_start_z = int((sl.mExtendMinZ - ds.GetExtendMinZ()) / voxel_len_z)
-        block_end_z = int((sl.mExtendMaxZ - ds.GetExtendMinZ()) / voxel_len_z + 1)
-
-        block_start_x = max(0, block_start_x)
-        block_start_y = max(0, block_start_y)
-        block_start_z = max(0, block_start_z)
-
-        block_end_x = min(label_img.shape[0] - 1, block_end_x)
-        block_end_y = min(label_img.shape[1] - 1, block_end_y)
-        block_end_z = min(label_img.shape[2] - 1, block_end_z)
-
-        simgle_mask = surface.GetSingleMask(
-            i,
-            sl.mExtendMinX,
-            sl.mExtendMinY,
-            sl.mExtendMinZ,
-            sl.mExtendMaxX,
-            sl.mExtendMaxY,
-            sl.mExtendMaxZ,
-            block_end_x - block_start_x,
-            block_end_y - block_start_y,
-            block_end_z - block_start_z,
-        )
-        arr_single_mask = np.array(simgle_mask.GetDataShorts(), dtype=bool)[0, 0]
-
-        block = label_img[
-            block_start_x:block_end_x,
-            block_start_y:block_end_y,
-            block_start_z:block_end_z,
-        ]
-
-        # binary indexing here to set label id
-        if block.shape != arr_single_mask.shape:
-            print(
-                f"Warning: shape mismatch block != mask :{block.shape} != {arr_single_mask.shap}. Resizing..."
-            )
-            arr_single_mask = resize(
-                arr_single_mask, output_shape=block.shape, order=0
-            ).astype(bool)
-        block[arr_single_mask] = i + 1
-
-    return label_img
-
-
 @exceptionPrinter
 def main(aImarisId):
     # Create an ImarisLib object
@@ -148,6 +95,7 @@ def main(aImarisId):
     root = tk.Tk()
     root.withdraw()
 
+    print(f"Time to first dialog: {time.perf_counter() - xt_start_time:.2f}s")
     label_img_fn = filedialog.asksaveasfilename(
         parent=root,
         title="Save as .tif label image",
@@ -157,10 +105,55 @@ def main(aImarisId):
     )
 
     if len(label_img_fn) > 0:
-        label_img = getSurfaceLabelImage(sel_surfaces, DataSet)
+        checkpoint = checkpoints.RasterCheckpoint(
+            label_img_fn[:-4] + ".checkpoint",
+            checkpoints.surfaceKey(
+                Imaris.GetCurrentFileName(),
+                surface_name,
+                rasterize.surfaceFingerprint(sel_surfaces),
+                DataSet,
+                label_stores.labelDtype(len(sel_surfaces.GetIds())),
+            ),
+        )
+        label_img = rasterize.getSurfaceLabelImage(
+            sel_surfaces, DataSet, checkpoint=checkpoint
+        )
         label_img = label_img.swapaxes(0, 2)[:, None]
+        imagej = True
+        if label_img.dtype.itemsize > 2:
+            # ImageJ has no 32-bit integer images; float32 holds labels < 2**24
+            if len(sel_surfaces.GetIds()) < 2**24:
+                label_img = label_img.astype(np.float32)
+            else:
+                print(
+                    "2**24 or more objects: writing a plain uint32 TIFF, "
+                    "which ImageJ cannot open as label image"
+                )
+                imagej = False
         print(f"Writing label image of surface {surface_name} to {label_img_fn}...")
-        tifffile.imsave(label_img_fn, label_img, imagej=True)
+        writer = async_writer.BackgroundWriter()
+        try:
+            writer.submit(
+                label_img_fn,
+                functools.partial(tifffile.imsave, data=label_img, imagej=imagej),
+            )
+
+            # label l in the image belongs to Imaris object ids[l - 1]
+            ids = np.asarray(sel_surfaces.GetIds(), dtype=np.int64)
+            writer.submit(
+                label_img_fn[:-4] + ".ids.tab",
+                functools.partial(
+                    np.savetxt,
+                    X=np.stack([np.arange(1, len(ids) + 1), ids], axis=1),
+                    fmt="%d",
+                    delimiter="\t",
+                    header="label\timaris_id",
+                    comments="",
+                ),
+            )
+        finally:
+            writer.close()
+        print(writer.summary())
         messagebox.showinfo(
             title="Label Image Exort",
             message=f"Label image of surface {surface_name} exported to {label_img_fn}",
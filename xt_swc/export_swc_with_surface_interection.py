@@ -16,7 +16,16 @@
 
 try:
     # Standard library imports
+    import time
+
+    xt_start_time = time.perf_counter()
+
+    import functools
+    import itertools
+    import os
     import traceback
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
 
     # GUI imports
     import tkinter as tk
@@ -24,15 +33,27 @@ try:
     from tkinter import simpledialog
 
     # More imports
-    import ImarisLib
-
-    import tifffile
-    import numpy as np
-    import pandas as pd
-    from skimage import measure, morphology
-    from skimage.draw import line_nd
-    from skimage.transform import resize
-    from tqdm.auto import tqdm, trange
+    import warm_worker
+
+    # Heavy imports are deferred to the stage that first uses them
+    from lazy_import import lazyImport
+
+    tifffile = lazyImport("tifffile")
+    np = lazyImport("numpy")
+    pd = lazyImport("pandas")
+    measure = lazyImport("skimage.measure")
+    draw = lazyImport("skimage.draw")
+
+    tree_metrics = lazyImport("tree_metrics")
+    filament_distances = lazyImport("filament_distances")
+    shared_volumes = lazyImport("shared_volumes")
+    label_stores = lazyImport("label_stores")
+    mask_buffers = lazyImport("mask_buffers")
+    rasterize = lazyImport("rasterize")
+    checkpoints = lazyImport("checkpoints")
+    resource_planner = lazyImport("resource_planner")
+    colocalization = lazyImport("colocalization")
+    async_writer = lazyImport("async_writer")
 
 except:
     print(traceback.format_exc())
@@ -44,6 +65,9 @@ def exceptionPrinter(do_stuff):
         try:
             do_stuff(*args, **kwargs)
         except Exception:
+            if warm_worker.in_worker:
+                # the worker has no console; the calling XTension reports it
+                raise
             print(traceback.format_exc())
             input("Error: hit Return to close...")
 
@@ -52,7 +76,7 @@ def exceptionPrinter(do_stuff):
 
 def getImaris(aImarisId):
     # Create an ImarisLib object
-    vImarisLib = ImarisLib.ImarisLib()
+    vImarisLib = warm_worker.getImarisLib()
 
     # Get an imaris object with id aImarisId
     vImaris = vImarisLib.GetApplication(aImarisId)
@@ -124,7 +148,7 @@ def getMaskLabelImage(surface, DataSet):
     m = surface.GetMask(
         *extent, DataSet.GetSizeX(), DataSet.GetSizeY(), DataSet.GetSizeZ(), 0
     )
-    mask = np.array(m.GetDataShorts())[0, 0]
+    mask = mask_buffers.getMaskArray(m)
     label_img = measure.label(mask)
 
     nSurfaces = len(surface.GetIds())
@@ -141,8 +165,9 @@ def askForSurfacesToProcess(Scene, Imaris):
         def __init__(self):
             self.ok = False
 
-        def run(self, ok):
+        def run(self, ok, dry_run=False):
             self.ok = ok
+            self.dry_run = dry_run
             root.destroy()
 
     runit = RunIt()
@@ -181,105 +206,276 @@ def askForSurfacesToProcess(Scene, Imaris):
         command=lambda: runit.run(False),
     ).grid(row=2, column=0)
 
+    tk.Button(
+        root,
+        text="Plan only",
+        command=lambda: runit.run(True, dry_run=True),
+    ).grid(row=2, column=2)
+
+    print(f"Time to first dialog: {time.perf_counter() - xt_start_time:.2f}s")
     root.mainloop()
 
     if not runit.ok:
         # User said: Cancel
-        return {}
+        return {}, False
 
-    return {k[0]: k[1] for k, v in vars.items() if v.get() > 0}
+    return {k[0]: k[1] for k, v in vars.items() if v.get() > 0}, runit.dry_run
 
 
-def getSurfaceLabelImage(surface, ds):
-    nSurfaces = len(surface.GetIds())
-
-    label_img = np.zeros((ds.GetSizeX(), ds.GetSizeY(), ds.GetSizeZ()), np.uint16)
+def getLabelIds(surface):
+    """Imaris object ID of each label: label l belongs to object ids[l - 1]"""
+    return np.asarray(surface.GetIds(), dtype=np.int64)
 
-    voxel_len_x = (ds.GetExtendMaxX() - ds.GetExtendMinX()) / ds.GetSizeX()
-    voxel_len_y = (ds.GetExtendMaxY() - ds.GetExtendMinY()) / ds.GetSizeY()
-    voxel_len_z = (ds.GetExtendMaxZ() - ds.GetExtendMinZ()) / ds.GetSizeZ()
 
-    for i in trange(nSurfaces):
-        sl = surface.GetSurfaceDataLayout(i)
+def getRegionProps(label_img):
+    if isinstance(label_img, label_stores.SparseLabelStore):
+        return label_img.regionprops()
+    return measure.regionprops_table(
+        label_img,
+        properties=(
+            "label",
+            "area",
+            "centroid",
+            # "inertia_tensor_eigvals",
+            # "equivalent_diameter_area",
+            # "feret_diameter_max"
+        ),
+    )
 
-        block_start_x = int((sl.mExtendMinX - ds.GetExtendMinX()) / voxel_len_x)
-        block_end_x = int((sl.mExtendMaxX - ds.GetExtendMinX()) / voxel_len_x + 1)
 
-        block_start_y = int((sl.mExtendMinY - ds.GetExtendMinY()) / voxel_len_y)
-        block_end_y = int((sl.mExtendMaxY - ds.GetExtendMinY()) / voxel_len_y + 1)
+def createLabelStore(DataSet, storage, n_labels, volumes, directory=None):
+    """Empty label image of the given storage kind: dense, sparse or memmap"""
+    shape = (DataSet.GetSizeX(), DataSet.GetSizeY(), DataSet.GetSizeZ())
+    dtype = label_stores.labelDtype(n_labels)
+    if storage == "sparse":
+        return label_stores.SparseLabelStore(shape, dtype)
+    if storage == "memmap":
+        volume = shared_volumes.SharedVolume(
+            shape, dtype, use_file=True, directory=directory
+        )
+        if volumes is not None:
+            volumes.append(volume)
+        return volume.array
+    return np.zeros(shape, dtype)
+
+
+def getCheckpoint(checkpoint_dir, Imaris, DataSet, surface_name, n_labels, fingerprint):
+    if checkpoint_dir is None:
+        return None
+    return checkpoints.RasterCheckpoint(
+        checkpoints.surfaceDirectory(checkpoint_dir, surface_name),
+        checkpoints.surfaceKey(
+            Imaris.GetCurrentFileName(),
+            surface_name,
+            fingerprint,
+            DataSet,
+            label_stores.labelDtype(n_labels),
+        ),
+    )
 
-        block_start_z = int((sl.mExtendMinZ - ds.GetExtendMinZ()) / voxel_len_z)
-        block_end_z = int((sl.mExtendMaxZ - ds.GetExtendMinZ()) / voxel_len_z + 1)
 
-        block_start_x = max(0, block_start_x)
-        block_start_y = max(0, block_start_y)
-        block_start_z = max(0, block_start_z)
+def rasterizeSurfaceWorker(aImarisId, si, volume_spec, checkpoint=None):
+    # runs in a worker process: reconnect to Imaris, fill the shared label
+    # volume and measure it while it is hot. Sparse stores (no volume_spec)
+    # are returned to the parent instead.
+    vImaris = warm_worker.getImarisLib().GetApplication(aImarisId)
+    DataSet = vImaris.GetDataSet()
+    surface = vImaris.GetFactory().ToSurfaces(vImaris.GetSurpassScene().GetChild(si))
 
-        block_end_x = min(label_img.shape[0] - 1, block_end_x)
-        block_end_y = min(label_img.shape[1] - 1, block_end_y)
-        block_end_z = min(label_img.shape[2] - 1, block_end_z)
+    if volume_spec is None:
+        label_img = createLabelStore(DataSet, "sparse", len(surface.GetIds()), None)
+        rasterize.getSurfaceLabelImage(
+            surface, DataSet, label_img=label_img, checkpoint=checkpoint
+        )
+        return getRegionProps(label_img), label_img
 
-        simgle_mask = surface.GetSingleMask(
-            i,
-            sl.mExtendMinX,
-            sl.mExtendMinY,
-            sl.mExtendMinZ,
-            sl.mExtendMaxX,
-            sl.mExtendMaxY,
-            sl.mExtendMaxZ,
-            block_end_x - block_start_x,
-            block_end_y - block_start_y,
-            block_end_z - block_start_z,
+    volume = shared_volumes.SharedVolume.attach(*volume_spec)
+    try:
+        rasterize.getSurfaceLabelImage(
+            surface, DataSet, label_img=volume.array, checkpoint=checkpoint
         )
-        arr_single_mask = np.array(simgle_mask.GetDataShorts(), dtype=bool)[0, 0]
+        return getRegionProps(volume.array), None
+    finally:
+        volume.close()
+
+
+def getLabelCacheKey(Imaris, DataSet, surface_name, fingerprint):
+    # fingerprint: rasterize.surfaceFingerprint, covers IDs and object extents
+    return (
+        Imaris.GetCurrentFileName(),
+        surface_name,
+        fingerprint,
+        (DataSet.GetSizeX(), DataSet.GetSizeY(), DataSet.GetSizeZ()),
+        tuple(getExtent(DataSet)),
+    )
 
-        block = label_img[
-            block_start_x:block_end_x,
-            block_start_y:block_end_y,
-            block_start_z:block_end_z,
-        ]
 
-        # binary indexing here to set label id
-        if block.shape != arr_single_mask.shape:
-            print(
-                f"Warning: shape mismatch block != mask :{block.shape} != {arr_single_mask.shape}. Trying resizing..."
-            )
-            arr_single_mask = resize(
-                arr_single_mask, output_shape=block.shape, order=0
-            ).astype(bool)
-        block[arr_single_mask] = i + 1
+def getLabelImages(
+    Imaris,
+    DataSet,
+    Scene,
+    surface_dict,
+    aImarisId=None,
+    n_workers=1,
+    volumes=None,
+    storage=None,
+    directory=None,
+    checkpoint_dir=None,
+):
+    """Rasterize the selected surfaces into label images
 
-    return label_img
+    storage maps surface names to "dense" (default), "sparse" or "memmap"
+    label storage; memory-mapped files are created in directory.
+
+    With checkpoint_dir, rasterization progress is checkpointed there per
+    surface and resumed after an interruption.
+
+    With n_workers > 1, surfaces are rasterized and measured in parallel
+    worker processes which write into shared volumes; the returned arrays
+    are views on them (no copy). The SharedVolume objects (also used for
+    memmap storage) are appended to volumes, if given, for the caller to
+    close; their memory is freed once the returned arrays are released.
 
+    Inside the warm worker, label images are cached between invocations.
 
-def getLabelImages(Imaris, DataSet, Scene, surface_dict):
+    Label images use the smallest dtype holding all objects of a surface.
+
+    Returns (label_img_dict, regionprops_dict, label_id_dict);
+    regionprops_dict only holds surfaces measured by workers, label_id_dict
+    maps labels to Imaris object IDs (see getLabelIds).
+    """
     label_img_dict = {}
+    regionprops_dict = {}
+    label_id_dict = {}
+    storage = storage or {}
+    if volumes is None:
+        volumes = []
+
+    fingerprints = {}
+    cache_keys = {}
+    todo_dict = {}
     for surface_name, si in surface_dict.items():
-        print(f"{surface_name}: exporting surface label img table...")
         surface = Imaris.GetFactory().ToSurfaces(Scene.GetChild(si))
+        label_id_dict[surface_name] = getLabelIds(surface)
+        fingerprints[surface_name] = rasterize.surfaceFingerprint(surface)
+        cache_keys[surface_name] = getLabelCacheKey(
+            Imaris, DataSet, surface_name, fingerprints[surface_name]
+        )
+        label_img = warm_worker.label_cache.get(cache_keys[surface_name])
+        if label_img is not None:
+            print(f"{surface_name}: using cached surface label img")
+            label_img_dict[surface_name] = label_img
+        else:
+            todo_dict[surface_name] = si
+
+    n_workers = min(n_workers, len(todo_dict))
+    if aImarisId is None or n_workers <= 1:
+        for surface_name, si in todo_dict.items():
+            print(f"{surface_name}: exporting surface label img table...")
+            surface = Imaris.GetFactory().ToSurfaces(Scene.GetChild(si))
+
+            # mask = getSurfaceLabelImage(surface, V, scale=1)
+            label_img = createLabelStore(
+                DataSet,
+                storage.get(surface_name, "dense"),
+                len(label_id_dict[surface_name]),
+                volumes,
+                directory,
+            )
+            label_img_dict[surface_name] = rasterize.getSurfaceLabelImage(
+                surface,
+                DataSet,
+                label_img=label_img,
+                checkpoint=getCheckpoint(
+                    checkpoint_dir,
+                    Imaris,
+                    DataSet,
+                    surface_name,
+                    len(label_id_dict[surface_name]),
+                    fingerprints[surface_name],
+                ),
+            )
+    else:
+        shape = (DataSet.GetSizeX(), DataSet.GetSizeY(), DataSet.GetSizeZ())
+        print(
+            f"Exporting {len(todo_dict)} surface label images with {n_workers} workers..."
+        )
 
-        # mask = getSurfaceLabelImage(surface, V, scale=1)
-        label_img = getSurfaceLabelImage(surface, DataSet)
-        label_img_dict[surface_name] = label_img
+        futures = {}
+        with ProcessPoolExecutor(
+            n_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            for surface_name, si in todo_dict.items():
+                kind = storage.get(surface_name, "dense")
+                volume_spec = None
+                if kind != "sparse":
+                    volume = shared_volumes.SharedVolume(
+                        shape,
+                        label_stores.labelDtype(len(label_id_dict[surface_name])),
+                        use_file=kind == "memmap",
+                        # only memmap storage belongs next to the .ims file
+                        directory=directory if kind == "memmap" else None,
+                    )
+                    volumes.append(volume)
+                    label_img_dict[surface_name] = volume.array
+                    volume_spec = volume.spec()
+                futures[surface_name] = pool.submit(
+                    rasterizeSurfaceWorker,
+                    aImarisId,
+                    si,
+                    volume_spec,
+                    getCheckpoint(
+                        checkpoint_dir,
+                        Imaris,
+                        DataSet,
+                        surface_name,
+                        len(label_id_dict[surface_name]),
+                        fingerprints[surface_name],
+                    ),
+                )
+
+            for surface_name, future in futures.items():
+                rp, sparse_store = future.result()
+                regionprops_dict[surface_name] = rp
+                if sparse_store is not None:
+                    label_img_dict[surface_name] = sparse_store
+                print(f"{surface_name}: done")
+
+    if checkpoint_dir is not None and os.path.isdir(checkpoint_dir):
+        # all surfaces done: only empty surface directories would be left
+        if not os.listdir(checkpoint_dir):
+            os.rmdir(checkpoint_dir)
+
+    for surface_name in todo_dict:
+        warm_worker.label_cache.put(
+            cache_keys[surface_name], label_img_dict[surface_name]
+        )
 
-    return label_img_dict
+    label_img_dict = {sn: label_img_dict[sn] for sn in surface_dict}
+    return label_img_dict, regionprops_dict, label_id_dict
 
 
-def exportLabelImageFeatures(label_img_dict, filename_base, soma_pos, pixel_size):
+def exportLabelImageFeatures(
+    label_img_dict,
+    filename_base,
+    soma_pos,
+    pixel_size,
+    swc_tab=None,
+    regionprops_dict=None,
+    label_id_dict=None,
+    writer=None,
+):
+    write = writer.submit if writer is not None else async_writer.atomicWrite
     for surface_name, label_img in label_img_dict.items():
-        rp = measure.regionprops_table(
-            label_img,
-            properties=(
-                "label",
-                "area",
-                "centroid",
-                # "inertia_tensor_eigvals",
-                # "equivalent_diameter_area",
-                # "feret_diameter_max"
-            ),
-        )
+        if regionprops_dict is not None and surface_name in regionprops_dict:
+            rp = regionprops_dict[surface_name]
+        else:
+            rp = getRegionProps(label_img)
 
         rp_tab = pd.DataFrame(rp)
+        if label_id_dict is not None:
+            ids = label_id_dict[surface_name]
+            rp_tab.insert(1, "imaris_id", ids[rp_tab["label"].to_numpy() - 1])
 
         rp_tab["area"] = rp_tab["area"] * np.prod(pixel_size)
         rename_map = {"area": "volume_um"}
@@ -292,7 +488,70 @@ def exportLabelImageFeatures(label_img_dict, filename_base, soma_pos, pixel_size
         xyz = rp_tab[[f"centroid-{'xyz'[d]}_um" for d in range(3)]].to_numpy()
         rp_tab["distance_to_soma_um"] = np.linalg.norm(xyz - soma_pos, axis=1)
 
-        rp_tab.to_csv(f"{filename_base}_{surface_name}.tab", sep="\t", index=False)
+        if swc_tab is not None:
+            nearest_node, node_dist, segment_dist = (
+                filament_distances.nearestFilamentDistances(
+                    # voxel k covers [k, k + 1) * pixel_size, see draw.line_nd
+                    # in exportExtendedSWC; compare nodes with voxel centers
+                    xyz + 0.5 * pixel_size,
+                    swc_tab[["x", "y", "z"]].to_numpy(dtype=float),
+                    tree_metrics.swcParents(
+                        swc_tab["ParentID"].to_numpy(dtype=np.int64)
+                    ),
+                )
+            )
+            rp_tab["nearest_node_id"] = swc_tab["SampleID"].to_numpy()[nearest_node]
+            rp_tab["distance_to_nearest_node_um"] = node_dist
+            rp_tab["distance_to_filament_um"] = segment_dist
+
+        write(
+            f"{filename_base}_{surface_name}.tab",
+            functools.partial(rp_tab.to_csv, sep="\t", index=False),
+        )
+
+
+def exportColocalization(
+    label_img_dict, label_id_dict, filename_base, pixel_size, writer=None
+):
+    """Write object-by-object overlaps for every pair of surfaces as sparse table"""
+    write = writer.submit if writer is not None else async_writer.atomicWrite
+
+    # every surface takes part in several pairs; find its objects only once
+    boxes = {
+        sn: colocalization.labelBoundingBox(labels)
+        for sn, labels in label_img_dict.items()
+    }
+
+    for (name_a, labels_a), (name_b, labels_b) in itertools.combinations(
+        label_img_dict.items(), 2
+    ):
+        print(f"{name_a} / {name_b}: exporting colocalization table...")
+        if boxes[name_a] is None or boxes[name_b] is None:
+            # a surface without objects in the image overlaps nothing
+            label_a = label_b = n_voxels = np.zeros(0, np.int64)
+        else:
+            label_a, label_b, n_voxels = colocalization.overlapCounts(
+                labels_a,
+                labels_b,
+                n_labels_b=len(label_id_dict[name_b]),
+                box_a=boxes[name_a],
+                box_b=boxes[name_b],
+            )
+
+        coloc_tab = pd.DataFrame(
+            {
+                f"{name_a}_label": label_a,
+                f"{name_a}_imaris_id": label_id_dict[name_a][label_a - 1],
+                f"{name_b}_label": label_b,
+                f"{name_b}_imaris_id": label_id_dict[name_b][label_b - 1],
+                "overlap_voxels": n_voxels,
+                "overlap_volume_um": n_voxels * np.prod(pixel_size),
+            }
+        )
+        write(
+            f"{filename_base}_{name_a}_{name_b}.coloc.tab",
+            functools.partial(coloc_tab.to_csv, sep="\t", index=False),
+        )
 
 
 def getPixelSize(DataSet):
@@ -307,8 +566,24 @@ def getPixelSize(DataSet):
 
 
 def exportExtendedSWC(
-    DataSet, Filament, label_img_dict, filename_base, db_create_tif=False
+    DataSet,
+    Filament,
+    label_img_dict,
+    filename_base,
+    db_create_tif=False,
+    add_tree_metrics=False,
+    label_id_dict=None,
+    writer=None,
 ):
+    """Write the extended SWC of the largest sub-filament
+
+    For every surface, an extra column lists the labels intersected by the
+    edge to the parent node, or their Imaris object IDs if label_id_dict is
+    given (column {surface}_ids instead of {surface}_labels).
+
+    With a BackgroundWriter, files are written while the caller continues.
+    """
+    write = writer.submit if writer is not None else async_writer.atomicWrite
     savename = f"{filename_base}.extended.swc"
     n_surfaces = len(label_img_dict)
 
@@ -343,16 +618,27 @@ def exportExtendedSWC(
         G[p1, p2] = True
         G[p2, p1] = True
 
-    # traverse through the Filament using BFS
+    soma_idx = Filament.GetBeginningVertexIndex(vFilamentIndex)
+    soma_pos = filamentXYZ[soma_idx] - origin_offset
+
+    # traverse through the Filament using BFS, rooted at the soma
     swc = np.zeros((N, 7 + n_surfaces), dtype=object)
-    visited[0] = True
-    queue = [0]
+    swc_row_of_vertex = np.full(N, -1)
+    visited[soma_idx] = True
+    queue = [soma_idx]
     prevs = [-1]
     last_cur = [-1]
 
     db_out_dict = {}
-    for sn, limg in label_img_dict.items():
-        db_out_dict[sn] = limg.copy()
+    if db_create_tif:
+        for sn, limg in label_img_dict.items():
+            # room for the debug values 100 + label on top of the labels
+            n_labels = (
+                len(label_id_dict[sn]) if label_id_dict is not None else limg.max()
+            )
+            db_out_dict[sn] = np.array(
+                limg, dtype=label_stores.labelDtype(int(n_labels) + 100)
+            )
 
     while queue:
         cur = queue.pop()
@@ -369,6 +655,7 @@ def exportExtendedSWC(
             filamentRadius[cur],
             prev,
         ] + [-1] * n_surfaces
+        swc_row_of_vertex[cur] = head
         pos = filamentXYZ[cur] - origin_offset
         swc[head, 2:5] = pos
 
@@ -381,14 +668,18 @@ def exportExtendedSWC(
                 np.int32
             )
 
-            ll = line_nd(src_px, des_px, endpoint=True)
+            ll = draw.line_nd(src_px, des_px, endpoint=True)
 
             for i, (surface_name, mask) in enumerate(label_img_dict.items()):
-                a = list(set(mask[ll]) - {0})
+                a = sorted(set(mask[ll].tolist()) - {0})
 
-                db_out_dict[surface_name][ll] = 100
+                if db_create_tif:
+                    db_out_dict[surface_name][ll] = 100
+                    if len(a) > 0:
+                        db_out_dict[surface_name][ll] = a[0] + 100
                 if len(a) > 0:
-                    db_out_dict[surface_name][ll] = a[0] + 100
+                    if label_id_dict is not None:
+                        a = label_id_dict[surface_name][np.array(a) - 1].tolist()
                     swc[head, 7 + i] = ",".join(map(str, a))
 
         for idx in np.where(G[cur])[0]:
@@ -402,27 +693,42 @@ def exportExtendedSWC(
     if db_create_tif:
         for k, v in db_out_dict.items():
             print(k)
-            tifffile.imsave(
-                f"{filename_base}_{k}_db.tif", v[:, None].swapaxes(0, 3), imagej=True
+            write(
+                f"{filename_base}_{k}_db.tif",
+                functools.partial(
+                    tifffile.imsave, data=v[:, None].swapaxes(0, 3), imagej=True
+                ),
             )
 
     swc_tab = pd.DataFrame(
         swc,
         columns=["SampleID", "TypeID", "x", "y", "z", "r", "ParentID"]
-        + [f"{sn}_labels" for sn in label_img_dict.keys()],
+        + [
+            f"{sn}_ids" if label_id_dict is not None else f"{sn}_labels"
+            for sn in label_img_dict.keys()
+        ],
     )
-    print("Export to " + savename, end="... ")
-    swc_tab.to_csv(savename, sep=" ", index=False)
-    print("done")
 
-    soma_idx = Filament.GetBeginningVertexIndex(vFilamentIndex)
-    soma_pos = filamentXYZ[soma_idx] - origin_offset
+    if add_tree_metrics:
+        metrics = tree_metrics.computeTreeMetrics(
+            tree_metrics.swcParents(swc[:, 6].astype(np.int64)),
+            swc[:, 2:5].astype(float),
+            soma=swc_row_of_vertex[soma_idx],
+        )
+        for name, values in metrics.items():
+            swc_tab[name] = values
+
+    print("Export to " + savename)
+    write(savename, functools.partial(swc_tab.to_csv, sep=" ", index=False))
 
-    return soma_pos
+    return soma_pos, swc_tab
 
 
 @exceptionPrinter
 def main(aImarisId):
+    if warm_worker.delegate(__name__, "main", aImarisId):
+        return
+
     # Create an ImarisLib object
     Imaris, DataSet, Scene = getImaris(aImarisId)
 
@@ -432,7 +738,7 @@ def main(aImarisId):
     filename_base = Imaris.GetCurrentFileName()[:-4]
 
     # User Dialog to select surfaces
-    surface_dict = askForSurfacesToProcess(Scene, Imaris)
+    surface_dict, dry_run = askForSurfacesToProcess(Scene, Imaris)
 
     if len(surface_dict) == 0:
         tk.Tk().withdraw()
@@ -445,12 +751,78 @@ def main(aImarisId):
     # Get user selected Surfaces
     # print(surface_dict)
 
-    label_img_dict = getLabelImages(Imaris, DataSet, Scene, surface_dict)
+    plan = resource_planner.planExport(
+        DataSet,
+        Filament,
+        {
+            sn: Imaris.GetFactory().ToSurfaces(Scene.GetChild(si))
+            for sn, si in surface_dict.items()
+        },
+    )
+    print(plan.report())
 
-    soma_pos = exportExtendedSWC(DataSet, Filament, label_img_dict, filename_base)
+    if dry_run:
+        tk.Tk().withdraw()
+        messagebox.showinfo("Resource plan (dry run)", plan.report())
+        return
+
+    volumes = []
+    writer = async_writer.BackgroundWriter()
+    try:
+        label_img_dict, regionprops_dict, label_id_dict = getLabelImages(
+            Imaris,
+            DataSet,
+            Scene,
+            surface_dict,
+            aImarisId=aImarisId,
+            n_workers=plan.n_workers,
+            volumes=volumes,
+            storage=plan.storage,
+            directory=os.path.dirname(filename_base) or None,
+            checkpoint_dir=f"{filename_base}.checkpoints",
+        )
 
-    pixel_size = getPixelSize(DataSet)
-    exportLabelImageFeatures(label_img_dict, filename_base, soma_pos, pixel_size)
+        soma_pos, swc_tab = exportExtendedSWC(
+            DataSet,
+            Filament,
+            label_img_dict,
+            filename_base,
+            add_tree_metrics=True,
+            label_id_dict=label_id_dict,
+            writer=writer,
+        )
+
+        pixel_size = getPixelSize(DataSet)
+        exportLabelImageFeatures(
+            label_img_dict,
+            filename_base,
+            soma_pos,
+            pixel_size,
+            swc_tab=swc_tab,
+            regionprops_dict=regionprops_dict,
+            label_id_dict=label_id_dict,
+            writer=writer,
+        )
 
+        exportColocalization(
+            label_img_dict, label_id_dict, filename_base, pixel_size, writer=writer
+        )
+    except BaseException:
+        # finish pending writes, but keep the original error
+        try:
+            writer.close()
+        except Exception:
+            print(f"Writing output failed as well:\n{traceback.format_exc()}")
+        raise
+    else:
+        writer.close()
+    finally:
+        for volume in volumes:
+            volume.close()
+
+    print(writer.summary())
     tk.Tk().withdraw()
-    messagebox.showinfo("Success", "Extended SWC and Surfaces have been exported.")
+    messagebox.showinfo(
+        "Success",
+        f"Extended SWC and Surfaces have been exported.\n\n{writer.summary()}",
+    )
@@ -18,12 +18,14 @@
 import traceback
 
 try:
-    import ImarisLib
+    import warm_worker
+    import async_writer
     import tkinter as tk
     from tkinter import messagebox
 
     from tkinter.filedialog import asksaveasfilename
     import numpy as np
+    import functools
     import time
 
 except:
@@ -36,6 +38,9 @@ def exceptionPrinter(do_stuff):
         try:
             do_stuff(*args, **kwargs)
         except Exception:
+            if warm_worker.in_worker:
+                # the worker has no console; the calling XTension reports it
+                raise
             print(traceback.format_exc())
             input("Error: hit Return to close...")
 
@@ -52,8 +57,11 @@ def ExportSWC_px(aImarisId):
 
 @exceptionPrinter
 def ExportSWC(aImarisId, in_pixel):
+    if warm_worker.delegate(__name__, "ExportSWC", aImarisId, in_pixel):
+        return
+
     # Create an ImarisLib object
-    vImarisLib = ImarisLib.ImarisLib()
+    vImarisLib = warm_worker.getImarisLib()
     # Get an imaris object with id aImarisId
     vImaris = vImarisLib.GetApplication(aImarisId)
     # Check if the object is valid
@@ -108,59 +116,72 @@ def ExportSWC(aImarisId, in_pixel):
         return
     print(savename)
 
-    for k, vFilaments in enumerate(filemnt_objs):
-        # go through Filaments and convert to SWC format
-
-        vCount = vFilaments.GetNumberOfFilaments()
-        for vFilamentIndex in range(vCount):
-            head = 0
-            vFilamentsXYZ = vFilaments.GetPositionsXYZ(vFilamentIndex)
-            vFilamentsEdges = vFilaments.GetEdges(vFilamentIndex)
-            vFilamentsRadius = vFilaments.GetRadii(vFilamentIndex)
-            vFilamentsTypes = vFilaments.GetTypes(vFilamentIndex)
-
-            # vFilamentsTime = vFilaments.GetTimeIndex(vFilamentIndex)
-
-            N = len(vFilamentsXYZ)
-            G = np.zeros((N, N), np.bool)
-            visited = np.zeros(N, np.bool)
-
-            for p1, p2 in vFilamentsEdges:
-                G[p1, p2] = True
-                G[p2, p1] = True
-
-            # traverse through the Filament using BFS
-            swc = np.zeros((N, 7))
-            visited[0] = True
-            queue = [0]
-            prevs = [-1]
-            while queue:
-                cur = queue.pop()
-                prev = prevs.pop()
-                swc[head] = [
-                    head + 1,
-                    vFilamentsTypes[cur],
-                    0,
-                    0,
-                    0,
-                    vFilamentsRadius[cur],
-                    prev,
-                ]
-                swc[head, 2:5] = vFilamentsXYZ[cur] - pixel_offset
-                if in_pixel:
-                    swc[head, 2:5] *= pixel_scale
-
-                for idx in np.where(G[cur])[0]:
-                    if not visited[idx]:
-                        visited[idx] = True
-                        queue.append(idx)
-                        prevs.append(head + 1)
-                head = head + 1
-            # write to file
-
-            fil_out = savename[:-4] + f"_filament_{k:03d}_id_{vFilamentIndex:02d}.swc"
-            np.savetxt(fil_out, swc, "%d %d %f %f %f %f %d")
-            print("Export to " + fil_out + " completed")
+    # files are written in the background while the next filament is converted
+    writer = async_writer.BackgroundWriter()
+    try:
+        for k, vFilaments in enumerate(filemnt_objs):
+            # go through Filaments and convert to SWC format
+
+            vCount = vFilaments.GetNumberOfFilaments()
+            for vFilamentIndex in range(vCount):
+                head = 0
+                vFilamentsXYZ = vFilaments.GetPositionsXYZ(vFilamentIndex)
+                vFilamentsEdges = vFilaments.GetEdges(vFilamentIndex)
+                vFilamentsRadius = vFilaments.GetRadii(vFilamentIndex)
+                vFilamentsTypes = vFilaments.GetTypes(vFilamentIndex)
+
+                # vFilamentsTime = vFilaments.GetTimeIndex(vFilamentIndex)
+
+                N = len(vFilamentsXYZ)
+                G = np.zeros((N, N), np.bool)
+                visited = np.zeros(N, np.bool)
+
+                for p1, p2 in vFilamentsEdges:
+                    G[p1, p2] = True
+                    G[p2, p1] = True
+
+                # traverse through the Filament using BFS
+                swc = np.zeros((N, 7))
+                visited[0] = True
+                queue = [0]
+                prevs = [-1]
+                while queue:
+                    cur = queue.pop()
+                    prev = prevs.pop()
+                    swc[head] = [
+                        head + 1,
+                        vFilamentsTypes[cur],
+                        0,
+                        0,
+                        0,
+                        vFilamentsRadius[cur],
+                        prev,
+                    ]
+                    swc[head, 2:5] = vFilamentsXYZ[cur] - pixel_offset
+                    if in_pixel:
+                        swc[head, 2:5] *= pixel_scale
+
+                    for idx in np.where(G[cur])[0]:
+                        if not visited[idx]:
+                            visited[idx] = True
+                            queue.append(idx)
+                            prevs.append(head + 1)
+                    head = head + 1
+                # write to file
+
+                fil_out = (
+                    savename[:-4] + f"_filament_{k:03d}_id_{vFilamentIndex:02d}.swc"
+                )
+                writer.submit(
+                    fil_out,
+                    functools.partial(np.savetxt, X=swc, fmt="%d %d %f %f %f %f %d"),
+                )
+    finally:
+        # queued SWCs are still written if a filament fails
+        writer.close()
+    print(writer.summary())
 
     tk.Tk().withdraw()
-    messagebox.showinfo("Success", "SWCs have been successfully exported.")
+    messagebox.showinfo(
+        "Success", f"SWCs have been successfully exported.\n\n{writer.summary()}"
+    )
@@ -0,0 +1,60 @@
+#
+#
+#  Nearest filament node and segment for a set of points
+#
+#  Nodes are found with a KD-tree over the filament vertices. Segments
+#  (node -> parent) are refined exactly: the closest segment lies within
+#  d_node + max_segment_length / 2 of its midpoint, so a ball query on a
+#  KD-tree of segment midpoints yields all candidates.
+#
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def _pointSegmentDistance(p, a, b):
+    ab = b - a
+    ab_len2 = np.einsum("ij,ij->i", ab, ab)
+    t = np.einsum("ij,ij->i", p - a, ab) / np.where(ab_len2 > 0, ab_len2, 1)
+    t = np.clip(t, 0, 1)
+    return np.linalg.norm(p - (a + t[:, None] * ab), axis=1)
+
+
+def nearestFilamentDistances(points, node_xyz, parent):
+    """For each point, the nearest filament node and the distance to the nearest segment
+
+    points: (M, 3) query positions
+    node_xyz: (N, 3) filament node positions
+    parent: 0-based parent index per node, -1 for root(s)
+
+    Returns (nearest_node, node_distance, segment_distance)
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    node_xyz = np.asarray(node_xyz, dtype=float)
+    parent = np.asarray(parent, dtype=np.int64)
+
+    node_distance, nearest_node = cKDTree(node_xyz).query(points)
+    segment_distance = node_distance.copy()
+
+    seg_child = np.flatnonzero(parent >= 0)
+    if len(points) == 0 or len(seg_child) == 0:
+        return nearest_node, node_distance, segment_distance
+
+    seg_a = node_xyz[seg_child]
+    seg_b = node_xyz[parent[seg_child]]
+    max_half_len = np.linalg.norm(seg_b - seg_a, axis=1).max() / 2
+
+    candidates = cKDTree((seg_a + seg_b) / 2).query_ball_point(
+        points, node_distance + max_half_len
+    )
+    n_cand = np.fromiter(map(len, candidates), dtype=np.int64, count=len(points))
+    if n_cand.sum() == 0:
+        return nearest_node, node_distance, segment_distance
+
+    point_idx = np.repeat(np.arange(len(points)), n_cand)
+    seg_idx = np.concatenate([np.asarray(c, dtype=np.int64) for c in candidates])
+
+    d = _pointSegmentDistance(points[point_idx], seg_a[seg_idx], seg_b[seg_idx])
+    np.minimum.at(segment_distance, point_idx, d)
+
+    return nearest_node, node_distance, segment_distance
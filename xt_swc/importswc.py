@@ -19,7 +19,7 @@
 import traceback
 
 try:
-    import ImarisLib
+    import warm_worker
     import tkinter as tk
     from tkinter import messagebox
 
@@ -38,6 +38,9 @@ def exceptionPrinter(do_stuff):
         try:
             do_stuff(*args, **kwargs)
         except Exception:
+            if warm_worker.in_worker:
+                # the worker has no console; the calling XTension reports it
+                raise
             print(traceback.format_exc())
             input("Error: hit Return to close...")
 
@@ -54,8 +57,11 @@ def ImportSWC_px(aImarisId):
 
 @exceptionPrinter
 def ImportSWC(aImarisId, in_pixel):
+    if warm_worker.delegate(__name__, "ImportSWC", aImarisId, in_pixel):
+        return
+
     # Create an ImarisLib object
-    vImarisLib = ImarisLib.ImarisLib()
+    vImarisLib = warm_worker.getImarisLib()
     # Get an imaris object with id aImarisId
     vImaris = vImarisLib.GetApplication(aImarisId)
     # Check if the object is valid
@@ -0,0 +1,161 @@
+#
+#
+#  Label image storage backends
+#
+#  Besides plain (or shared / memory-mapped) numpy arrays, surfaces with few
+#  small objects in a large dataset can be kept in a SparseLabelStore, which
+#  only allocates the chunks of the volume that contain objects.
+#
+
+import numpy as np
+
+
+def labelDtype(n_labels):
+    """Smallest unsigned integer dtype holding labels 0..n_labels"""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_labels <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def checkLabelCapacity(label_img, n_labels):
+    if n_labels > np.iinfo(label_img.dtype).max:
+        raise ValueError(
+            f"{n_labels} labels do not fit into a {label_img.dtype} label image"
+        )
+
+
+def paintBlock(label_img, start, mask, value):
+    """Set label value where mask is True, mask placed at voxel start"""
+    if isinstance(label_img, SparseLabelStore):
+        label_img.paint(start, mask, value)
+        return
+    block = label_img[tuple(slice(s, s + n) for s, n in zip(start, mask.shape))]
+    block[mask] = value
+
+
+class SparseLabelStore:
+    """Chunked label volume allocating only chunks which contain labels
+
+    Supports point lookup with a tuple of index arrays (as returned by
+    skimage.draw) and dense sub-blocks with a tuple of slices.
+    """
+
+    def __init__(self, shape, dtype, chunk_size=64):
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+        self.chunk_size = chunk_size
+        self.chunks = {}
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in self.chunks.values())
+
+    def _chunkSlices(self, key):
+        return tuple(
+            slice(k * self.chunk_size, min((k + 1) * self.chunk_size, n))
+            for k, n in zip(key, self.shape)
+        )
+
+    def _overlappingChunks(self, start, stop):
+        ranges = [
+            range(a // self.chunk_size, (b - 1) // self.chunk_size + 1)
+            for a, b in zip(start, stop)
+        ]
+        for kx in ranges[0]:
+            for ky in ranges[1]:
+                for kz in ranges[2]:
+                    yield (kx, ky, kz)
+
+    def paint(self, start, mask, value):
+        start = np.asarray(start, dtype=np.int64)
+        stop = start + mask.shape
+        for key in self._overlappingChunks(start, stop):
+            chunk_sl = self._chunkSlices(key)
+            lo = np.maximum(start, [s.start for s in chunk_sl])
+            hi = np.minimum(stop, [s.stop for s in chunk_sl])
+            sub_mask = mask[tuple(slice(a, b) for a, b in zip(lo - start, hi - start))]
+            if not sub_mask.any():
+                continue
+            if key not in self.chunks:
+                self.chunks[key] = np.zeros(
+                    tuple(s.stop - s.start for s in chunk_sl), self.dtype
+                )
+            origin = np.array([s.start for s in chunk_sl])
+            self.chunks[key][
+                tuple(slice(a, b) for a, b in zip(lo - origin, hi - origin))
+            ][sub_mask] = value
+
+    def __getitem__(self, index):
+        if all(isinstance(i, slice) for i in index):
+            return self._getBlock(index)
+
+        coords = np.stack([np.asarray(i, dtype=np.int64) for i in index])
+        values = np.zeros(coords.shape[1], self.dtype)
+        keys = coords // self.chunk_size
+        for key in {tuple(k) for k in keys.T}:
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                continue
+            sel = np.all(keys == np.array(key)[:, None], axis=0)
+            local = coords[:, sel] - np.array(key)[:, None] * self.chunk_size
+            values[sel] = chunk[tuple(local)]
+        return values
+
+    def _getBlock(self, index):
+        index = tuple(slice(*sl.indices(n)[:2]) for sl, n in zip(index, self.shape))
+        start = np.array([sl.start for sl in index])
+        stop = np.maximum(start, [sl.stop for sl in index])
+        block = np.zeros(tuple(stop - start), self.dtype)
+        if np.any(stop <= start):
+            return block
+        for key in self._overlappingChunks(start, stop):
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                continue
+            chunk_sl = self._chunkSlices(key)
+            origin = np.array([s.start for s in chunk_sl])
+            lo = np.maximum(start, origin)
+            hi = np.minimum(stop, origin + chunk.shape)
+            block[tuple(slice(a, b) for a, b in zip(lo - start, hi - start))] = chunk[
+                tuple(slice(a, b) for a, b in zip(lo - origin, hi - origin))
+            ]
+        return block
+
+    def toDense(self):
+        return self._getBlock(tuple(slice(0, n) for n in self.shape))
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.toDense()
+        return dense if dtype is None else dense.astype(dtype)
+
+    def copy(self):
+        other = SparseLabelStore(self.shape, self.dtype, self.chunk_size)
+        other.chunks = {k: c.copy() for k, c in self.chunks.items()}
+        return other
+
+    def max(self):
+        return max((c.max() for c in self.chunks.values()), default=0)
+
+    def regionprops(self):
+        """label, area and centroid per label, as from skimage regionprops_table"""
+        n_labels = int(self.max()) + 1
+        area = np.zeros(n_labels)
+        coord_sum = np.zeros((self.ndim, n_labels))
+        for key, chunk in self.chunks.items():
+            nz = np.nonzero(chunk)
+            labels = chunk[nz]
+            area += np.bincount(labels, minlength=n_labels)
+            for d in range(self.ndim):
+                coord_sum[d] += np.bincount(
+                    labels,
+                    weights=nz[d] + key[d] * self.chunk_size,
+                    minlength=n_labels,
+                )
+
+        present = np.flatnonzero(area[1:] > 0) + 1
+        rp = {"label": present, "area": area[present]}
+        for d in range(self.ndim):
+            rp[f"centroid-{d}"] = coord_sum[d, present] / area[present]
+        return rp
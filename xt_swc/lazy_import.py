@@ -0,0 +1,36 @@
+#
+#
+#  Deferred imports for the XTensions
+#
+#  Every XTension call starts a fresh Python. Heavy dependencies are bound
+#  to module placeholders which import the real module on first attribute
+#  access, so only the stages that actually run pay for their imports.
+#
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Placeholder for a module which is imported on first attribute access"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._lazy_module = None
+
+    def __getattr__(self, attr):
+        if attr == "_lazy_module":
+            raise AttributeError(attr)
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self.__name__)
+        return getattr(self._lazy_module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._lazy_module is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazyImport(name):
+    """Return the module if already imported, a LazyModule placeholder otherwise"""
+    return sys.modules.get(name) or LazyModule(name)
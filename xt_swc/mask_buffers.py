@@ -0,0 +1,31 @@
+#
+#
+#  Bulk retrieval of Imaris mask data sets
+#
+#  GetDataShorts returns nested Python lists, one int per voxel, which
+#  numpy has to walk element by element. 8 bit masks can instead be fetched
+#  as one flat byte sequence (x fastest) and wrapped without conversion.
+#
+
+import numpy as np
+
+
+def _isUInt8(data_set):
+    try:
+        return str(data_set.GetType()).endswith("eTypeUInt8")
+    except AttributeError:
+        return False
+
+
+def getMaskArray(data_set):
+    """First channel and time point of a mask data set as (x, y, z) bool array"""
+    if _isUInt8(data_set) and hasattr(data_set, "GetDataVolumeAs1DArrayBytes"):
+        shape = (data_set.GetSizeZ(), data_set.GetSizeY(), data_set.GetSizeX())
+        buf = data_set.GetDataVolumeAs1DArrayBytes(0, 0)
+        if isinstance(buf, (bytes, bytearray, memoryview)):
+            flat = np.frombuffer(buf, dtype=np.uint8)
+        else:
+            flat = np.asarray(buf, dtype=np.uint8)
+        return flat.reshape(shape).T != 0
+
+    return np.array(data_set.GetDataShorts(), dtype=bool)[0, 0]
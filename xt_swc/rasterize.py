@@ -0,0 +1,127 @@
+#
+#
+#  Rasterization of Imaris surfaces into label images
+#
+#  Every object's mask is requested from Imaris on the dataset voxel grid of
+#  its bounding box and painted into the label store with label i + 1.
+#
+
+import hashlib
+
+import numpy as np
+from tqdm.auto import trange
+
+import label_stores
+import mask_buffers
+
+
+def surfaceFingerprint(surface):
+    """Hash of the object IDs and bounding boxes of surface
+
+    Rebuilding a surface (e.g. with another threshold) keeps the IDs
+    0..N-1 for the same object count but changes the object extents.
+    """
+    ids = np.asarray(surface.GetIds(), dtype=np.int64)
+    extents = np.zeros((len(ids), 6))
+    for i in range(len(ids)):
+        sl = surface.GetSurfaceDataLayout(i)
+        extents[i] = [
+            sl.mExtendMinX,
+            sl.mExtendMinY,
+            sl.mExtendMinZ,
+            sl.mExtendMaxX,
+            sl.mExtendMaxY,
+            sl.mExtendMaxZ,
+        ]
+    return hashlib.sha1(ids.tobytes() + extents.tobytes()).hexdigest()
+
+
+def remapMaskNearest(mask, shape):
+    """Nearest-neighbor remap of a mask to shape using integer strides"""
+    idx = [((2 * np.arange(n) + 1) * m) // (2 * n) for m, n in zip(mask.shape, shape)]
+    return mask[np.ix_(*idx)]
+
+
+def getSurfaceLabelImage(surface, ds, label_img=None, checkpoint=None):
+    """Label image of surface; object i gets label i + 1
+
+    Label l thus belongs to Imaris object surface.GetIds()[l - 1]. A
+    label_img (dense array or SparseLabelStore) is filled in place.
+
+    With a checkpoint, finished objects are journaled periodically and
+    replayed by the next run for the same dataset and surface.
+    """
+    nSurfaces = len(surface.GetIds())
+
+    if label_img is None:
+        label_img = np.zeros(
+            (ds.GetSizeX(), ds.GetSizeY(), ds.GetSizeZ()),
+            label_stores.labelDtype(nSurfaces),
+        )
+    label_stores.checkLabelCapacity(label_img, nSurfaces)
+    img_shape = np.array(label_img.shape)
+
+    ext_min = np.array([ds.GetExtendMinX(), ds.GetExtendMinY(), ds.GetExtendMinZ()])
+    ext_max = np.array([ds.GetExtendMaxX(), ds.GetExtendMaxY(), ds.GetExtendMaxZ()])
+    voxel_len = (ext_max - ext_min) / img_shape
+
+    done = set()
+    if checkpoint is not None:
+        done = checkpoint.resume(label_img, label_stores.paintBlock)
+
+    n_remapped = 0
+    try:
+        for i in trange(nSurfaces):
+            if i in done:
+                continue
+
+            sl = surface.GetSurfaceDataLayout(i)
+            sl_min = np.array([sl.mExtendMinX, sl.mExtendMinY, sl.mExtendMinZ])
+            sl_max = np.array([sl.mExtendMaxX, sl.mExtendMaxY, sl.mExtendMaxZ])
+
+            # dataset grid voxels covering the surface, including the last one
+            block_start = np.floor((sl_min - ext_min) / voxel_len).astype(int)
+            block_end = np.floor((sl_max - ext_min) / voxel_len).astype(int) + 1
+
+            block_start = np.clip(block_start, 0, img_shape)
+            block_end = np.clip(block_end, 0, img_shape)
+            block_size = block_end - block_start
+            if np.any(block_size <= 0):
+                if checkpoint is not None:
+                    checkpoint.record(i)
+                continue
+
+            # request the mask exactly on the dataset grid of the block
+            grid_min = ext_min + block_start * voxel_len
+            grid_max = ext_min + block_end * voxel_len
+
+            simgle_mask = surface.GetSingleMask(
+                i,
+                *map(float, grid_min),
+                *map(float, grid_max),
+                *map(int, block_size),
+            )
+            arr_single_mask = mask_buffers.getMaskArray(simgle_mask)
+
+            # binary indexing here to set label id
+            if tuple(block_size) != arr_single_mask.shape:
+                n_remapped += 1
+                arr_single_mask = remapMaskNearest(arr_single_mask, block_size)
+            label_stores.paintBlock(label_img, block_start, arr_single_mask, i + 1)
+            if checkpoint is not None:
+                checkpoint.record(i, block_start, arr_single_mask)
+    except BaseException:
+        if checkpoint is not None:
+            checkpoint.flush()
+            print("Progress saved to checkpoint, run again to resume.")
+        raise
+
+    if checkpoint is not None:
+        checkpoint.finish()
+
+    if n_remapped > 0:
+        print(
+            f"Warning: shape mismatch block != mask for {n_remapped}/{nSurfaces} objects. Remapped to nearest voxel..."
+        )
+
+    return label_img
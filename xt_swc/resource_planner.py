@@ -0,0 +1,278 @@
+#
+#
+#  Resource planning for the extended SWC export
+#
+#  Estimates peak memory and runtime per stage from cheap queries to Imaris
+#  (dataset size, object counts, a sample of object bounding boxes and the
+#  filament vertex count) and chooses label storage and worker count. The
+#  per-voxel and per-object costs are rough figures measured on a
+#  workstation; they are meant to tell 500 MB from 50 GB, not to be exact.
+#
+
+import ctypes
+import os
+
+import numpy as np
+
+# rough costs
+SECONDS_PER_OBJECT = 2e-3  # GetSurfaceDataLayout + GetSingleMask round trip
+SECONDS_PER_MASK_VOXEL = 2e-8  # mask transfer, see benchmarks/mask_conversion.py
+SECONDS_PER_LABEL_VOXEL = 5e-9  # regionprops / intersection passes
+SECONDS_PER_SWC_NODE = 1e-4  # BFS and line drawing per filament node
+
+# use at most this fraction of the available memory for dense label images
+MEMORY_BUDGET_FRACTION = 0.5
+
+# prefer sparse storage if objects cover less than this fraction of a volume
+SPARSE_MAX_FILL = 0.05
+
+# objects whose bounding box is queried to estimate occupancy
+MAX_SAMPLED_OBJECTS = 500
+
+
+def getAvailableMemory():
+    """Available physical memory in bytes, None if unknown"""
+    if os.name == "nt":
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return int(status.ullAvailPhys)
+        return None
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def formatBytes(n):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def formatSeconds(t):
+    if t < 60:
+        return f"{t:.0f} s"
+    if t < 3600:
+        return f"{t / 60:.1f} min"
+    return f"{t / 3600:.1f} h"
+
+
+class SurfacePlan:
+    def __init__(self, name, n_objects, fill_fraction, mask_voxels, volume_voxels):
+        self.name = name
+        self.n_objects = n_objects
+        self.fill_fraction = fill_fraction
+        self.mask_voxels = mask_voxels
+        # label images use the smallest dtype holding all objects
+        itemsize = 1 if n_objects < 2**8 else 2 if n_objects < 2**16 else 4
+        self.dense_bytes = volume_voxels * itemsize
+        self.storage = "dense"
+
+    @property
+    def store_bytes(self):
+        if self.storage == "sparse":
+            # chunks around objects, allowing for partially filled chunks
+            return min(self.dense_bytes, 4 * self.fill_fraction * self.dense_bytes)
+        if self.storage == "memmap":
+            return 0
+        return self.dense_bytes
+
+    @property
+    def rasterize_seconds(self):
+        return (
+            self.n_objects * SECONDS_PER_OBJECT
+            + self.mask_voxels * SECONDS_PER_MASK_VOXEL
+        )
+
+
+class ExportPlan:
+    """Estimated resources per stage and the chosen execution backend"""
+
+    def __init__(self, shape, surfaces, n_filament_nodes, available_memory, n_cpus):
+        self.shape = shape
+        self.surfaces = surfaces
+        self.n_filament_nodes = n_filament_nodes
+        self.available_memory = available_memory
+        self.n_cpus = n_cpus
+        self.n_workers = 1
+        self.choose()
+
+    @property
+    def volume_voxels(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def storage(self):
+        return {s.name: s.storage for s in self.surfaces}
+
+    @property
+    def swc_bytes(self):
+        # dense N x N adjacency matrix plus the SWC table
+        return self.n_filament_nodes**2 + self.n_filament_nodes * 200
+
+    @property
+    def swc_seconds(self):
+        return self.n_filament_nodes * SECONDS_PER_SWC_NODE
+
+    @property
+    def features_seconds(self):
+        return sum(
+            self.volume_voxels * SECONDS_PER_LABEL_VOXEL
+            for s in self.surfaces
+            if s.storage != "sparse"
+        )
+
+    @property
+    def colocalization_seconds(self):
+        n = len(self.surfaces)
+        return n * (n - 1) / 2 * self.volume_voxels * SECONDS_PER_LABEL_VOXEL
+
+    @property
+    def peak_bytes(self):
+        stores = sum(s.store_bytes for s in self.surfaces)
+        return stores + self.swc_bytes
+
+    @property
+    def total_seconds(self):
+        rasterize = [s.rasterize_seconds for s in self.surfaces]
+        # surfaces are distributed over workers, bounded by the slowest one
+        parallel = max(sum(rasterize) / self.n_workers, max(rasterize, default=0))
+        return (
+            parallel
+            + self.swc_seconds
+            + self.features_seconds
+            + self.colocalization_seconds
+        )
+
+    def choose(self):
+        budget = (
+            MEMORY_BUDGET_FRACTION * self.available_memory
+            if self.available_memory is not None
+            else np.inf
+        )
+
+        for s in self.surfaces:
+            s.storage = "sparse" if s.fill_fraction < SPARSE_MAX_FILL else "dense"
+
+        # move the largest dense surfaces to disk until the rest fits
+        for s in sorted(self.surfaces, key=lambda s: -s.store_bytes):
+            if self.peak_bytes <= budget:
+                break
+            if s.storage == "dense":
+                s.storage = "memmap"
+
+        if len(self.surfaces) > 1:
+            n_workers = min(len(self.surfaces), self.n_cpus)
+            if self.available_memory is not None:
+                # every worker holds its mask blocks and Python/Imaris overhead
+                per_worker = 256 * 2**20
+                spare = max(0, budget - self.peak_bytes)
+                n_workers = min(n_workers, spare // per_worker)
+            self.n_workers = int(max(1, n_workers))
+
+    def report(self):
+        lines = [
+            f"Dataset: {' x '.join(map(str, self.shape))} voxels",
+            f"Filament: {self.n_filament_nodes} nodes",
+            "Available memory: "
+            + (
+                formatBytes(self.available_memory)
+                if self.available_memory is not None
+                else "unknown"
+            ),
+            "",
+        ]
+        for s in self.surfaces:
+            lines.append(
+                f"Surface '{s.name}': {s.n_objects} objects, "
+                f"{100 * s.fill_fraction:.2f}% of volume in bounding boxes -> "
+                f"{s.storage} storage ({formatBytes(s.store_bytes)} in memory), "
+                f"rasterization ~{formatSeconds(s.rasterize_seconds)}"
+            )
+        lines += [
+            f"SWC export: ~{formatBytes(self.swc_bytes)}, "
+            f"~{formatSeconds(self.swc_seconds)}",
+            f"Surface features: ~{formatSeconds(self.features_seconds)}",
+            f"Colocalization: ~{formatSeconds(self.colocalization_seconds)}",
+            "",
+            f"Workers: {self.n_workers}",
+            f"Estimated peak memory: {formatBytes(self.peak_bytes)}",
+            f"Estimated runtime: {formatSeconds(self.total_seconds)}",
+        ]
+        return "\n".join(lines)
+
+
+def planSurface(name, surface, volume_voxels, voxel_len):
+    n_objects = len(surface.GetIds())
+    n_sampled = min(n_objects, MAX_SAMPLED_OBJECTS)
+
+    box_voxels = 0
+    for i in np.linspace(0, n_objects - 1, n_sampled).astype(int):
+        sl = surface.GetSurfaceDataLayout(int(i))
+        size = (
+            np.array(
+                [
+                    sl.mExtendMaxX - sl.mExtendMinX,
+                    sl.mExtendMaxY - sl.mExtendMinY,
+                    sl.mExtendMaxZ - sl.mExtendMinZ,
+                ]
+            )
+            / voxel_len
+        )
+        box_voxels += np.prod(np.floor(size) + 1)
+
+    mask_voxels = box_voxels * n_objects / max(1, n_sampled)
+    fill_fraction = min(1.0, mask_voxels / volume_voxels)
+    return SurfacePlan(name, n_objects, fill_fraction, mask_voxels, volume_voxels)
+
+
+def planExport(DataSet, Filament, surfaces):
+    """Plan the export of the given {surface_name: surface} with Filament"""
+    shape = (DataSet.GetSizeX(), DataSet.GetSizeY(), DataSet.GetSizeZ())
+    ext_min = np.array(
+        [DataSet.GetExtendMinX(), DataSet.GetExtendMinY(), DataSet.GetExtendMinZ()]
+    )
+    ext_max = np.array(
+        [DataSet.GetExtendMaxX(), DataSet.GetExtendMaxY(), DataSet.GetExtendMaxZ()]
+    )
+    voxel_len = (ext_max - ext_min) / np.array(shape)
+    volume_voxels = int(np.prod(shape))
+
+    n_filament_nodes = max(
+        (
+            len(Filament.GetPositionsXYZ(f))
+            for f in range(Filament.GetNumberOfFilaments())
+        ),
+        default=0,
+    )
+
+    surface_plans = [
+        planSurface(name, surface, volume_voxels, voxel_len)
+        for name, surface in surfaces.items()
+    ]
+
+    return ExportPlan(
+        shape,
+        surface_plans,
+        n_filament_nodes,
+        getAvailableMemory(),
+        os.cpu_count() or 1,
+    )
@@ -0,0 +1,113 @@
+#
+#
+#  Label volumes shared between processes
+#
+#  Uses multiprocessing.shared_memory where available (Python >= 3.8) and
+#  falls back to a memory-mapped temporary file otherwise (Imaris Python 3.7).
+#  Volumes larger than the available memory can be file-backed explicitly.
+#
+#  The memory is tied to the lifetime of the array and all numpy views on it:
+#  closing a volume only releases this process' handle (and the name of the
+#  shared memory), the mapping itself is released once no view is left.
+#
+
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+class SharedVolume:
+    """A numpy array backed by shared memory, attachable from other processes by name"""
+
+    def __init__(self, shape, dtype, name=None, use_file=False, directory=None):
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        self.use_file = use_file or shared_memory is None
+        nbytes = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+
+        if not self.use_file:
+            self._shm = shared_memory.SharedMemory(
+                name=name, create=self.owner, size=nbytes if self.owner else 0
+            )
+            self.name = self._shm.name
+            self.array = np.ndarray(self.shape, self.dtype, buffer=self._shm.buf)
+            # views reference self.array, so this runs after the last view is gone
+            weakref.finalize(self.array, _releaseSharedMemory, self._shm, self.owner)
+            if self.owner:
+                self.array[...] = 0
+        else:
+            self._shm = None
+            if self.owner:
+                fd, name = tempfile.mkstemp(
+                    prefix="xt_swc_", suffix=".raw", dir=directory
+                )
+                os.close(fd)
+            self.name = name
+            self.array = np.memmap(
+                name, self.dtype, mode="w+" if self.owner else "r+", shape=self.shape
+            )
+            if self.owner:
+                # the mmap is closed when the memmap and all its views are gone;
+                # its finalizer runs after unmapping (required on Windows)
+                weakref.finalize(self.array._mmap, _removeFile, name)
+
+    def spec(self):
+        """Arguments to attach to this volume from another process"""
+        return self.shape, self.dtype.str, self.name, self.use_file
+
+    @classmethod
+    def attach(cls, shape, dtype, name, use_file=False):
+        return cls(shape, dtype, name=name, use_file=use_file)
+
+    def close(self):
+        """Release this process' handle on the volume
+
+        Existing views stay valid; the memory is freed with the last of them.
+        """
+        if self.array is None:
+            return
+        if self._shm is None:
+            self.array.flush()
+        elif self.owner:
+            # free the name now, the mapping lives on until unmapped
+            _unlinkSharedMemory(self._shm)
+        self.array = None
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _unlinkSharedMemory(shm):
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _releaseSharedMemory(shm, unlink):
+    try:
+        shm.close()
+    except BufferError:
+        # numpy still holds the buffer; the mapping is freed with shm itself
+        pass
+    if unlink:
+        _unlinkSharedMemory(shm)
+
+
+def _removeFile(name):
+    try:
+        os.remove(name)
+    except OSError:
+        pass
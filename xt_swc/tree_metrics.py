@@ -0,0 +1,119 @@
+#
+#
+#  Tree metrics on SWC parent arrays
+#
+#  All metrics are computed with vectorized passes over the parent array:
+#  root-to-node sums use pointer jumping (log2(depth) numpy passes) and
+#  leaf-to-root quantities are only resolved at branch points, since every
+#  unbranched chain simply inherits them from its end.
+#
+
+import numpy as np
+
+
+def swcParents(parent_ids):
+    """Convert 1-based SWC ParentIDs (-1 for root) to 0-based parent indices"""
+    parent = np.asarray(parent_ids, dtype=np.int64) - 1
+    parent[parent < 0] = -1
+    return parent
+
+
+def rerootParents(parent, root):
+    """Return a copy of parent with the tree containing root re-rooted at root"""
+    parent = np.array(parent, dtype=np.int64)
+    prev = -1
+    cur = root
+    while cur >= 0:
+        nxt = parent[cur]
+        parent[cur] = prev
+        prev = cur
+        cur = nxt
+    return parent
+
+
+def _ancestorSums(parent, weight):
+    # pointer jumping: after k passes acc[i] holds the sum of weights of the
+    # 2**k nearest ancestors-or-self of i
+    acc = np.array(weight, dtype=float)
+    anc = parent.copy()
+    for _ in range(len(parent) + 1):
+        has = np.flatnonzero(anc >= 0)
+        if len(has) == 0:
+            return acc
+        up = anc[has]
+        acc[has] += acc[up]
+        anc[has] = anc[up]
+    raise ValueError("Parent array contains a cycle")
+
+
+def _chainEnds(parent, n_children):
+    # for every node, the first node downstream with != 1 children
+    N = len(parent)
+    only_child = np.arange(N)
+    child = np.flatnonzero(parent >= 0)
+    single = n_children[parent[child]] == 1
+    only_child[parent[child[single]]] = child[single]
+
+    end = only_child
+    for _ in range(N + 1):
+        nxt = end[end]
+        if np.array_equal(nxt, end):
+            return end
+        end = nxt
+    raise ValueError("Parent array contains a cycle")
+
+
+def computeTreeMetrics(parent, xyz, soma=None):
+    """Per-node geodesic distance to soma, branch order, Strahler order and subtree length
+
+    parent: 0-based parent index per node, -1 for root(s)
+    xyz: (N, 3) node positions
+    soma: node index to re-root the tree at (default: keep roots)
+    """
+    parent = np.asarray(parent, dtype=np.int64)
+    xyz = np.asarray(xyz, dtype=float)
+    if soma is not None:
+        parent = rerootParents(parent, soma)
+
+    N = len(parent)
+    is_child = parent >= 0
+    child = np.flatnonzero(is_child)
+    n_children = np.bincount(parent[child], minlength=N)
+
+    edge_len = np.zeros(N)
+    edge_len[child] = np.linalg.norm(xyz[child] - xyz[parent[child]], axis=1)
+
+    path_len = _ancestorSums(parent, edge_len)
+    depth = _ancestorSums(parent, is_child.astype(float)).astype(np.int64)
+
+    # a branch point adds one order to everything below it; the soma does not
+    passes_branch = np.zeros(N)
+    passes_branch[child] = (n_children[parent[child]] > 1) & (
+        parent[parent[child]] >= 0
+    )
+    branch_order = _ancestorSums(parent, passes_branch).astype(np.int64)
+
+    # leaf-to-root quantities, resolved at leaves and branch points only
+    end = _chainEnds(parent, n_children)
+    strahler_end = np.ones(N, dtype=np.int64)
+    subtree_end = np.zeros(N)
+
+    branch_points = np.flatnonzero(n_children > 1)
+    by_parent = child[np.argsort(parent[child], kind="stable")]
+    first_child = np.concatenate([[0], np.cumsum(n_children)])
+
+    for b in branch_points[np.argsort(-depth[branch_points], kind="stable")]:
+        kids_end = end[by_parent[first_child[b] : first_child[b + 1]]]
+        orders = strahler_end[kids_end]
+        top = orders.max()
+        strahler_end[b] = top + 1 if (orders == top).sum() > 1 else top
+        subtree_end[b] = np.sum(
+            path_len[kids_end] - path_len[b] + subtree_end[kids_end]
+        )
+
+    return {
+        "path_to_soma_um": path_len,
+        "branch_order": branch_order,
+        "strahler_order": strahler_end[end],
+        "subtree_length_um": path_len[end] - path_len + subtree_end[end],
+    }
@@ -0,0 +1,251 @@
+#
+#
+#  Optional resident worker shared between XTension invocations
+#
+#  Imaris starts a fresh Python for every menu click. When the environment
+#  variable XT_SWC_WARM_WORKER is set (to 1 or to a port number), the thin
+#  entry points hand their call to a resident worker process instead, which
+#  keeps the imported scientific stack, the ImarisLib connection and
+#  rasterized surface label images warm between invocations.
+#
+#  The first invocation starts the worker in the background and runs
+#  locally; later invocations are delegated. The worker exits after being
+#  idle for XT_SWC_WARM_WORKER_IDLE_MIN minutes (default 60) and caches at
+#  most XT_SWC_WARM_WORKER_MB megabytes (default 4096) of label images,
+#  evicting the least recently used ones.
+#
+
+import collections
+import gc
+import importlib
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+DEFAULT_PORT = 47812
+KEY_FILE = os.path.join(os.path.expanduser("~"), ".xt_swc_warm_worker.key")
+
+# set in the worker process, so delegated entry points run locally there
+in_worker = False
+
+_imaris_lib = None
+
+
+def getAddress():
+    value = os.environ.get("XT_SWC_WARM_WORKER", "")
+    port = int(value) if value.isdigit() and int(value) > 1 else DEFAULT_PORT
+    return ("127.0.0.1", port)
+
+
+def isEnabled():
+    value = os.environ.get("XT_SWC_WARM_WORKER", "0")
+    return not in_worker and value not in ("", "0")
+
+
+def getAuthKey():
+    """Per-user secret; requests are pickled, so the worker only talks to its owner"""
+    if not os.path.exists(KEY_FILE):
+        fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(32))
+    with open(KEY_FILE, "rb") as f:
+        return f.read()
+
+
+def getImarisLib():
+    """ImarisLib instance, created once per process"""
+    global _imaris_lib
+    if _imaris_lib is None:
+        import ImarisLib
+
+        _imaris_lib = ImarisLib.ImarisLib()
+    return _imaris_lib
+
+
+class LabelStoreCache:
+    """LRU cache of label images with a memory cap in bytes"""
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._store = collections.OrderedDict()
+
+    def get(self, key):
+        if key not in self._store:
+            return None
+        self._store.move_to_end(key)
+        return self._store[key]
+
+    def put(self, key, label_img):
+        """Store a copy of label_img, evicting least recently used entries"""
+        if label_img.nbytes > self.max_bytes:
+            return
+        label_img = label_img.copy()
+        if key in self._store:
+            self.nbytes -= self._store.pop(key).nbytes
+        while self._store and self.nbytes + label_img.nbytes > self.max_bytes:
+            _, evicted = self._store.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        self._store[key] = label_img
+        self.nbytes += label_img.nbytes
+
+
+# only filled inside the worker; a plain XTension run exits right away
+label_cache = LabelStoreCache()
+
+
+class _ConnectionWriter:
+    # forwards stdout/stderr of a delegated call to the calling XTension;
+    # background threads (e.g. the output writer) print concurrently
+    def __init__(self, conn, stream, lock):
+        self.conn = conn
+        self.stream = stream
+        self.lock = lock
+
+    def write(self, text):
+        if text:
+            with self.lock:
+                self.conn.send(("output", self.stream, text))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def startWorker():
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = (
+            subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        )
+    else:
+        kwargs["start_new_session"] = True
+
+    # the worker needs the same module search path (ImarisLib, XTensions)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), str(getAddress()[1])],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        **kwargs,
+    )
+
+
+def delegate(module_name, function_name, *args):
+    """Run module_name.function_name(*args) in the warm worker
+
+    Returns False if the call must run locally: the worker is disabled, this
+    is the worker itself, or no worker is running yet (one is started then).
+    Errors raised in the worker are re-raised here as RuntimeError.
+    """
+    if not isEnabled():
+        return False
+
+    try:
+        conn = Client(getAddress(), authkey=getAuthKey())
+    except ConnectionRefusedError:
+        print("Starting warm worker for the next invocations...")
+        startWorker()
+        return False
+    except (AuthenticationError, OSError, EOFError) as e:
+        # port taken by a stale worker, another user's worker or another program
+        print(f"Warm worker unavailable ({e!r}), running locally")
+        return False
+
+    with conn:
+        conn.send((module_name, function_name, args))
+        while True:
+            message = conn.recv()
+            if message[0] == "output":
+                getattr(sys, message[1]).write(message[2])
+            elif message[0] == "error":
+                raise RuntimeError(f"Warm worker failed:\n{message[1]}")
+            else:
+                return True
+
+
+def _destroyTkRoots():
+    # entry points create hidden Tk roots for their message boxes, which
+    # would pile up in the long-lived worker
+    tkinter = sys.modules.get("tkinter")
+    if tkinter is None:
+        return
+    for obj in gc.get_objects():
+        if isinstance(obj, tkinter.Tk):
+            try:
+                obj.destroy()
+            except tkinter.TclError:
+                pass
+    tkinter._default_root = None
+
+
+def serve(address, max_bytes, idle_seconds):
+    global in_worker
+    in_worker = True
+    label_cache.max_bytes = max_bytes
+
+    last_active = [time.monotonic()]
+
+    def exitWhenIdle():
+        while time.monotonic() - last_active[0] < idle_seconds:
+            time.sleep(10)
+        os._exit(0)
+
+    threading.Thread(target=exitWhenIdle, daemon=True).start()
+
+    with Listener(address, authkey=getAuthKey()) as listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception:
+                # failed authentication or aborted client
+                continue
+
+            with conn:
+                # never idle while serving a call
+                last_active[0] = float("inf")
+                stdout, stderr = sys.stdout, sys.stderr
+                try:
+                    module_name, function_name, args = conn.recv()
+                    lock = threading.Lock()
+                    sys.stdout = _ConnectionWriter(conn, "stdout", lock)
+                    sys.stderr = _ConnectionWriter(conn, "stderr", lock)
+                    module = importlib.import_module(module_name)
+                    getattr(module, function_name)(*args)
+                    reply = ("done",)
+                except Exception:
+                    reply = ("error", traceback.format_exc())
+                finally:
+                    sys.stdout, sys.stderr = stdout, stderr
+                    _destroyTkRoots()
+                try:
+                    conn.send(reply)
+                except OSError:
+                    pass
+                last_active[0] = time.monotonic()
+
+
+if __name__ == "__main__":
+    # serve from the importable module, whose state the entry points share
+    import warm_worker
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    warm_worker.serve(
+        ("127.0.0.1", port),
+        max_bytes=int(os.environ.get("XT_SWC_WARM_WORKER_MB", "4096")) * 2**20,
+        idle_seconds=float(os.environ.get("XT_SWC_WARM_WORKER_IDLE_MIN", "60")) * 60,
+    )